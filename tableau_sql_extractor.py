@@ -5,14 +5,110 @@ Supports both local files and direct download from Tableau Server/Cloud
 """
 
 import zipfile
-import xml.etree.ElementTree as ET
+import io
 import os
 import sys
-import tempfile
+import shutil
 import re
+import functools
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from urllib.parse import urlparse
-import requests
+
+# Prefer lxml's libxml2-backed parser when it is installed; the stdlib
+# ElementTree exposes the same iterparse()/ParseError API as a fallback
+try:
+    from lxml import etree as ET
+    HAVE_LXML = True
+except ImportError:
+    import xml.etree.ElementTree as ET
+    HAVE_LXML = False
+
+# Extra iterparse() options understood by lxml (the stdlib parser takes none,
+# and expat already skips DTDs and external entities). .tds files need no DTD,
+# entities or network access, and dropping the pretty-print whitespace between
+# tags keeps the partial tree small. Comments and processing instructions are
+# dropped as the stdlib TreeBuilder does, so text around them stays joined in
+# .text instead of being split into a child's .tail.
+_ITERPARSE_OPTIONS = {
+    'huge_tree': True,
+    'collect_ids': False,
+    'resolve_entities': False,
+    'load_dtd': False,
+    'no_network': True,
+    'remove_blank_text': True,
+    'remove_comments': True,
+    'remove_pis': True,
+} if HAVE_LXML else {}
+
+# Downloads up to this size stay in memory; larger ones spill to a temp file
+_SPOOL_MAX_SIZE = 64 * 1024 * 1024
+
+# Buffer placed in front of each archive member so the parser's small reads
+# are served from memory and the member is decompressed in large blocks
+_MEMBER_BUFFER_SIZE = 1 << 20
+
+# Upper bound on .tds members parsed at the same time
+_MAX_PARSE_WORKERS = 4
+
+# Read size used when copying a download; large reads keep per-chunk overhead low
+_DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Site name and datasource ID in a web UI URL: /#/site/sitename/datasources/datasource-id
+_TABLEAU_URL_RE = re.compile(r'/site/([^/]+)/datasources/([a-zA-Z0-9\-]+)')
+
+# Characters not allowed in output filenames (\w is exactly str.isalnum() plus '_')
+_UNSAFE_FILENAME_RE = re.compile(r'[^\w\-]')
+
+# urlsplit() is already lru_cached by the stdlib on Python 3.11+; this also
+# caches urlparse()'s own _splitparams step and the resulting ParseResult
+_urlparse_cached = functools.lru_cache(maxsize=256)(urlparse)
+
+# CLI usage text, written to stdout in a single call
+_HELP = """\
+Tableau SQL Extractor - Extract SQL queries from .tdsx files
+
+Usage: tableau-sql <path_or_url> [output_directory] [--token <access_token>]
+
+Examples:
+  Local file:
+    tableau-sql mydata.tdsx
+    tableau-sql mydata.tdsx ./extracted_sql
+
+  Tableau Server/Cloud URL:
+    tableau-sql 'https://tableau.com/#/site/mysite/datasources/abc123'
+    tableau-sql 'https://tableau.com/#/site/mysite/datasources/abc123' --token YOUR_TOKEN
+
+  Direct REST API URL:
+    tableau-sql 'https://tableau.com/api/3.17/sites/site-id/datasources/ds-id/content' --token YOUR_TOKEN
+
+Options:
+  --token <token>    Access token for Tableau Server/Cloud authentication
+  --help, -h         Show this help message
+"""
+
+
+@functools.lru_cache(maxsize=None)
+def _get_session():
+    """
+    Shared session so repeated downloads reuse pooled keep-alive connections
+    
+    Built on first use, so runs against local files never import requests.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+    
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=16,
+        max_retries=Retry(total=3, backoff_factor=0.3),
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
 
 
 def download_from_tableau_server(url, access_token=None):
@@ -28,12 +124,16 @@ def download_from_tableau_server(url, access_token=None):
         access_token: Optional access token for authentication
     
     Returns:
-        Path to downloaded temporary file, or None if failed
+        Seekable file object holding the downloaded .tdsx (close it when
+        done), or None if failed
     """
+    import tempfile
+    import requests
+    
     print(f"Attempting to download from: {url}")
     
     # Parse the URL to extract components
-    parsed = urlparse(url)
+    parsed = _urlparse_cached(url)
     
     # Check if it's a direct REST API call or a web UI URL
     if '/api/' in url:
@@ -41,7 +141,7 @@ def download_from_tableau_server(url, access_token=None):
     else:
         # Try to extract site and datasource ID from web URL
         # Format: /#/site/sitename/datasources/datasource-id
-        match = re.search(r'/site/([^/]+)/datasources/([a-zA-Z0-9\-]+)', url)
+        match = _TABLEAU_URL_RE.search(url)
         
         if not match:
             print("Error: Could not parse Tableau URL. Expected format:")
@@ -76,19 +176,20 @@ def download_from_tableau_server(url, access_token=None):
     try:
         # Make the request
         print("Downloading...")
-        response = requests.get(api_url, headers=headers, stream=True)
+        response = _get_session().get(api_url, headers=headers, stream=True)
         response.raise_for_status()
         
-        # Save to temporary file
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.tdsx')
+        # Buffer in memory, only spilling to disk for very large data sources
+        temp_file = tempfile.SpooledTemporaryFile(max_size=_SPOOL_MAX_SIZE)
         
-        # Write in chunks
-        for chunk in response.iter_content(chunk_size=8192):
-            temp_file.write(chunk)
+        # Copy the raw stream in large chunks, still undoing any
+        # Content-Encoding the server applied
+        response.raw.decode_content = True
+        shutil.copyfileobj(response.raw, temp_file, length=_DOWNLOAD_CHUNK_SIZE)
         
-        temp_file.close()
-        print(f"Downloaded successfully to temporary file: {temp_file.name}")
-        return temp_file.name
+        print(f"Downloaded successfully ({temp_file.tell()} bytes)")
+        temp_file.seek(0)
+        return temp_file
         
     except requests.exceptions.HTTPError as e:
         print(f"HTTP Error: {e}")
@@ -102,94 +203,176 @@ def download_from_tableau_server(url, access_token=None):
         return None
 
 
-def extract_sql_from_tdsx(tdsx_path, output_dir=None):
+def _scan_tds(source):
+    """
+    Collect custom and initial SQL from a .tds document in a single pass
+    
+    Every <connection> reports the text <relation> elements nested anywhere
+    beneath it, and every <named-connection> reports the one-time-sql of the
+    first <connection> inside it.
+    
+    Args:
+        source: File-like object streaming the .tds XML
+    
+    Returns:
+        Tuple of (custom_sql, initial_sql) lists; custom_sql holds
+        (key, sql) pairs and initial_sql holds (connection name, sql) pairs
+    """
+    connections = []        # (class name, [stripped relation text, ...]) in document order
+    open_connections = []   # connections whose end tag has not been seen yet
+    named_connections = []  # [name, stripped initial SQL or None] in document order
+    open_named = []         # named-connections still waiting for their end tag
+    open_elements = []      # path from the root to the element being parsed
+    
+    for event, elem in ET.iterparse(source, events=('start', 'end'), **_ITERPARSE_OPTIONS):
+        tag = elem.tag
+        
+        if event == 'start':
+            if tag == 'connection':
+                # Get connection name/class for identification
+                conn_name = elem.get('class', f'connection_{len(connections) + 1}')
+                entry = (conn_name, [])
+                connections.append(entry)
+                open_connections.append(entry)
+                
+                # The first connection inside a named-connection carries its initial SQL
+                for named in open_named:
+                    if named[1] is None:
+                        named[1] = elem.get('one-time-sql', '').strip()
+            elif tag == 'named-connection':
+                named = [elem.get('name', 'unnamed'), None]
+                named_connections.append(named)
+                open_named.append(named)
+            
+            open_elements.append(elem)
+            continue
+        
+        if tag == 'connection':
+            open_connections.pop()
+        elif tag == 'named-connection':
+            open_named.pop()
+        elif tag == 'relation' and elem.get('type') == 'text':
+            # Tableau uses 'relation' elements with 'type="text"' for custom SQL.
+            # Strip once here; the result is shared by every enclosing connection.
+            sql_text = elem.text.strip() if elem.text else ''
+            for _, relations in open_connections:
+                relations.append(sql_text)
+        
+        # Everything needed from this element has been recorded, so detach it
+        # from its parent to keep memory bounded by the nesting depth
+        open_elements.pop()
+        if open_elements:
+            del open_elements[-1][:]
+    
+    custom_sql = []
+    for conn_name, relations in connections:
+        for rel_idx, sql_text in enumerate(relations, 1):
+            if sql_text:
+                key = f"{conn_name}_query_{rel_idx}" if len(relations) > 1 else conn_name
+                custom_sql.append((key, sql_text))
+    
+    initial_sql = [(name, sql) for name, sql in named_connections if sql]
+    
+    return custom_sql, initial_sql
+
+
+def extract_sql_from_tdsx(tdsx_path, output_dir=None, verbose=True):
     """
     Extract initial SQL queries from a Tableau packaged data source (.tdsx)
     
     Args:
-        tdsx_path: Path to the .tdsx file
+        tdsx_path: Path to the .tdsx file, or a seekable file object with its contents
         output_dir: Optional directory to save extracted SQL files
+        verbose: Report each query as it is found (default True)
     
     Returns:
         Dictionary with connection names as keys and SQL queries as values
     """
     sql_queries = {}
     
-    if not os.path.exists(tdsx_path):
-        print(f"Error: File not found: {tdsx_path}")
-        return sql_queries
+    # (key, sql) hits in discovery order; turned into the result dict in one go
+    pairs = []
+    
+    if isinstance(tdsx_path, (str, os.PathLike)):
+        if not os.path.exists(tdsx_path):
+            print(f"Error: File not found: {tdsx_path}")
+            return sql_queries
+        source_name = tdsx_path
+    else:
+        source_name = 'downloaded data source'
     
     try:
         # Open the .tdsx file (it's a zip archive)
         with zipfile.ZipFile(tdsx_path, 'r') as zip_ref:
             # Find the .tds file inside (usually named Data/Datasources/*.tds)
-            tds_files = [f for f in zip_ref.namelist() if f.endswith('.tds')]
+            # infolist() hands back the already-parsed central directory, and
+            # opening by ZipInfo skips the name lookup namelist() would need
+            tds_files = [info for info in zip_ref.infolist() if info.filename.endswith('.tds')]
             
             if not tds_files:
                 print("No .tds file found in the packaged data source")
                 return sql_queries
             
-            # Process each .tds file found
-            for tds_file in tds_files:
-                print(f"\nProcessing: {tds_file}")
+            # Members are opened (and later closed) here, since ZipFile does not
+            # guard its handle bookkeeping against concurrent open() calls;
+            # reads from the open handles are safe to share between threads
+            with contextlib.ExitStack() as stack:
+                xml_files = [
+                    stack.enter_context(io.BufferedReader(zip_ref.open(info), buffer_size=_MEMBER_BUFFER_SIZE))
+                    for info in tds_files
+                ]
                 
-                # Read the XML content
-                with zip_ref.open(tds_file) as xml_file:
-                    xml_content = xml_file.read()
+                # Federated data sources can hold several independent .tds
+                # files, so stream them into the parser concurrently. The pool
+                # is entered after the members, so it finishes before they close.
+                if len(xml_files) > 1:
+                    workers = min(_MAX_PARSE_WORKERS, len(xml_files))
+                    executor = stack.enter_context(ThreadPoolExecutor(max_workers=workers))
+                    results = executor.map(_scan_tds, xml_files)
+                else:
+                    # A single member has nothing to overlap with; parse it inline
+                    results = map(_scan_tds, xml_files)
                 
-                # Parse the XML
-                root = ET.fromstring(xml_content)
-                
-                # Find all connection elements with initial SQL
-                # Tableau uses 'relation' elements with 'type="text"' for custom SQL
-                connections = root.findall('.//connection')
-                
-                for idx, connection in enumerate(connections, 1):
-                    # Get connection name/class for identification
-                    conn_name = connection.get('class', f'connection_{idx}')
+                # Process each .tds file found, in archive order
+                for tds_file in tds_files:
+                    print(f"\nProcessing: {tds_file.filename}")
+                    custom_sql, initial_sql = next(results)
                     
-                    # Look for relation elements (custom SQL)
-                    relations = connection.findall('.//relation[@type="text"]')
+                    pairs.extend(custom_sql)
+                    pairs.extend((f"{name}_initial_sql", sql) for name, sql in initial_sql)
                     
-                    for rel_idx, relation in enumerate(relations, 1):
-                        sql_text = relation.text
-                        
-                        if sql_text and sql_text.strip():
-                            key = f"{conn_name}_query_{rel_idx}" if len(relations) > 1 else conn_name
-                            sql_queries[key] = sql_text.strip()
+                    if verbose:
+                        for key, _ in custom_sql:
                             print(f"  Found SQL in: {key}")
-                
-                # Also check for named-connection elements with initial-sql
-                named_connections = root.findall('.//named-connection')
-                for named_conn in named_connections:
-                    name = named_conn.get('name', 'unnamed')
-                    connection_elem = named_conn.find('.//connection')
-                    
-                    if connection_elem is not None:
-                        # Check for one-time-sql attribute
-                        initial_sql = connection_elem.get('one-time-sql')
-                        if initial_sql and initial_sql.strip():
-                            sql_queries[f"{name}_initial_sql"] = initial_sql.strip()
+                        for name, _ in initial_sql:
                             print(f"  Found initial SQL in: {name}")
     
     except zipfile.BadZipFile:
-        print(f"Error: {tdsx_path} is not a valid zip file")
+        print(f"Error: {source_name} is not a valid zip file")
     except ET.ParseError as e:
         print(f"Error parsing XML: {e}")
     except Exception as e:
         print(f"Unexpected error: {e}")
     
+    # Later duplicates win, exactly as repeated assignment would
+    sql_queries = dict(pairs)
+    
     # Save to files if output directory specified
     if output_dir and sql_queries:
         os.makedirs(output_dir, exist_ok=True)
         
+        # Text mode would turn '\n' into os.linesep; do that up front so each
+        # file can be written as already-encoded bytes in a single call
+        translate_newlines = os.linesep != '\n'
+        
         for name, sql in sql_queries.items():
             # Create safe filename
-            safe_name = "".join(c if c.isalnum() or c in ('-', '_') else '_' for c in name)
+            safe_name = _UNSAFE_FILENAME_RE.sub('_', name)
             output_path = os.path.join(output_dir, f"{safe_name}.sql")
             
-            with open(output_path, 'w', encoding='utf-8') as f:
-                f.write(sql)
+            if translate_newlines:
+                sql = sql.replace('\n', os.linesep)
+            Path(output_path).write_bytes(sql.encode('utf-8'))
             
             print(f"Saved: {output_path}")
     
@@ -200,20 +383,7 @@ def cli():
     """Command line interface entry point"""
     # Check for help flag
     if len(sys.argv) < 2 or sys.argv[1] in ['--help', '-h', 'help']:
-        print("Tableau SQL Extractor - Extract SQL queries from .tdsx files")
-        print("\nUsage: tableau-sql <path_or_url> [output_directory] [--token <access_token>]")
-        print("\nExamples:")
-        print("  Local file:")
-        print("    tableau-sql mydata.tdsx")
-        print("    tableau-sql mydata.tdsx ./extracted_sql")
-        print("\n  Tableau Server/Cloud URL:")
-        print("    tableau-sql 'https://tableau.com/#/site/mysite/datasources/abc123'")
-        print("    tableau-sql 'https://tableau.com/#/site/mysite/datasources/abc123' --token YOUR_TOKEN")
-        print("\n  Direct REST API URL:")
-        print("    tableau-sql 'https://tableau.com/api/3.17/sites/site-id/datasources/ds-id/content' --token YOUR_TOKEN")
-        print("\nOptions:")
-        print("  --token <token>    Access token for Tableau Server/Cloud authentication")
-        print("  --help, -h         Show this help message")
+        sys.stdout.write(_HELP)
         sys.exit(0 if len(sys.argv) > 1 else 1)
     
     # Parse arguments
@@ -234,21 +404,21 @@ def cli():
             i += 1
     
     # Check if it's a URL or local file
-    is_url = path_or_url.startswith('http://') or path_or_url.startswith('https://')
-    temp_file = None
+    is_url = path_or_url.startswith(('http://', 'https://'))
+    downloaded = None
     
     try:
         if is_url:
             # Download from Tableau Server/Cloud
-            tdsx_path = download_from_tableau_server(path_or_url, access_token)
-            if not tdsx_path:
+            downloaded = download_from_tableau_server(path_or_url, access_token)
+            if downloaded is None:
                 sys.exit(1)
-            temp_file = tdsx_path
+            tdsx_path = downloaded
         else:
             # Use local file
             tdsx_path = path_or_url
         
-        print(f"\nExtracting SQL from: {tdsx_path}")
+        print(f"\nExtracting SQL from: {path_or_url}")
         
         sql_queries = extract_sql_from_tdsx(tdsx_path, output_dir)
         
@@ -257,21 +427,18 @@ def cli():
             print(f"Found {len(sql_queries)} SQL query/queries:")
             print(f"{'='*60}\n")
             
-            for name, sql in sql_queries.items():
-                print(f"--- {name} ---")
-                print(sql)
-                print(f"\n{'-'*60}\n")
+            # Emit every query with one write rather than three print() calls each
+            separator = f"\n{'-'*60}\n\n"
+            sys.stdout.write("".join(
+                f"--- {name} ---\n{sql}\n{separator}" for name, sql in sql_queries.items()
+            ))
         else:
             print("\nNo SQL queries found in the data source.")
     
     finally:
-        # Clean up temporary file if we downloaded one
-        if temp_file and os.path.exists(temp_file):
-            try:
-                os.unlink(temp_file)
-                print(f"\nCleaned up temporary file: {temp_file}")
-            except:
-                pass
+        # Release the download buffer (and any spilled temp file) if we downloaded one
+        if downloaded is not None:
+            downloaded.close()
 
 
 if __name__ == "__main__":